@@ -0,0 +1,258 @@
+# Prompt text, project settings and memex settings shared by the weather
+# app agents. Prompt text is kept at module level (no indentation) so every
+# agent sends byte-identical text, which keeps OpenAI's prompt cache key
+# stable across them.
+import os
+import re
+import json
+import shlex
+
+# Patterns for node IDs in `memex add` / `memex status` output
+ADDED_NODE_RE = re.compile(r'Added node: ([0-9a-f]+)')
+NODE_ID_RE = re.compile(r'Node ID: ([0-9a-f]+)')
+
+# Extra `memex add` arguments from the environment (see README)
+MEMEX_ADD_FLAGS = tuple(shlex.split(os.environ.get("MEMEX_ADD_FLAGS", "")))
+
+# Directory layout of the generated project, created once per run
+REQUIRED_DIRS = (
+    "weather-app/frontend/src/components",
+    "weather-app/frontend/src/hooks",
+    "weather-app/frontend/src/types",
+    "weather-app/backend/src",
+)
+
+# Role, conventions and output rules; the start of every system message
+SYSTEM_PREAMBLE = """You are an expert full-stack TypeScript developer building a weather web app.
+
+Project conventions:
+- Frontend: React 18 + TypeScript, built with Vite
+- Functional components and hooks only, no class components
+- CSS modules for scoped styling
+- Backend: Node.js + Express with TypeScript
+- Strict TypeScript: explicit types for props and hook results
+- Handle loading and error states explicitly
+- Never hard-code secrets or API keys
+
+Output format:
+- Return complete, working files with no placeholders or TODOs
+- Put each file in its own fenced code block tagged with its language
+  (tsx, typescript, css, dockerfile, yaml)
+- Keep explanations short and outside the code blocks
+
+"""
+
+PROJECT_PLAN = """Weather Web App Development Plan:
+1. Frontend Setup (React + TypeScript)
+   - Weather display component
+   - Data fetching hook
+   - Error handling
+   - Loading states
+
+2. Backend API (Node/Express)
+   - Weather data endpoint
+   - Caching layer
+   - Error handling
+   - Rate limiting
+
+3. Weather API Integration
+   - API key management
+   - Data transformation
+   - Error handling
+   - Backup providers
+
+4. User Preferences
+   - Location storage
+   - Temperature unit preference
+   - Update frequency
+
+5. Deployment
+   - Environment setup
+   - Docker configuration
+   - CI/CD pipeline
+"""
+
+# Dependencies and configs written to disk by smart_agent_v2
+PROJECT_SETTINGS = {
+    "frontend_deps": {
+        "dependencies": {
+            "react": "^18.2.0",
+            "react-dom": "^18.2.0",
+            "axios": "^1.6.0",
+            "typescript": "^5.0.0"
+        },
+        "devDependencies": {
+            "@types/react": "^18.2.0",
+            "@types/react-dom": "^18.2.0",
+            "vite": "^5.0.0",
+            "@vitejs/plugin-react": "^4.0.0"
+        }
+    },
+    "backend_deps": {
+        "dependencies": {
+            "express": "^4.18.0",
+            "cors": "^2.8.5",
+            "typescript": "^5.0.0",
+            "axios": "^1.6.0"
+        },
+        "devDependencies": {
+            "@types/express": "^4.17.0",
+            "@types/cors": "^2.8.5",
+            "ts-node": "^10.9.0",
+            "nodemon": "^3.0.0"
+        }
+    },
+    "frontend_tsconfig": {
+        "compilerOptions": {
+            "target": "ES2020",
+            "useDefineForClassFields": True,
+            "lib": ["ES2020", "DOM", "DOM.Iterable"],
+            "module": "ESNext",
+            "skipLibCheck": True,
+            "moduleResolution": "bundler",
+            "allowImportingTsExtensions": True,
+            "resolveJsonModule": True,
+            "isolatedModules": True,
+            "noEmit": True,
+            "jsx": "react-jsx",
+            "strict": True,
+            "noUnusedLocals": True,
+            "noUnusedParameters": True,
+            "noFallthroughCasesInSwitch": True
+        },
+        "include": ["src"],
+        "references": [{"path": "./tsconfig.node.json"}]
+    },
+    "css_modules_types": """declare module '*.module.css' {
+  const classes: { [key: string]: string };
+  export default classes;
+}
+"""
+}
+
+# Human-readable rendering of PROJECT_SETTINGS, stored in memex and given
+# to the model; generated so it can't drift from the files written to disk
+PROJECT_CONFIG = f"""Weather Web App Configuration:
+
+# Project Structure
+/weather-app
+  /frontend
+    /src
+      /components
+      /hooks
+      /types
+    package.json
+    vite.config.ts
+    tsconfig.json
+    index.html
+  /backend
+    /src
+    package.json
+    tsconfig.json
+
+# Frontend Dependencies
+{json.dumps(PROJECT_SETTINGS["frontend_deps"], indent=2)}
+
+# Backend Dependencies
+{json.dumps(PROJECT_SETTINGS["backend_deps"], indent=2)}
+
+# TypeScript Configurations
+## Frontend tsconfig.json
+{json.dumps(PROJECT_SETTINGS["frontend_tsconfig"], indent=2)}
+
+# CSS Modules Type Definition
+{PROJECT_SETTINGS["css_modules_types"]}"""
+
+FRONTEND_DECISIONS = """Design Decisions for Weather Display:
+1. Using functional components with hooks for modern React practices
+2. TypeScript for type safety
+3. CSS modules for scoped styling
+4. Component will fetch data through a custom hook
+"""
+
+BACKEND_DECISIONS = """Backend Design Decisions:
+1. Express.js with TypeScript for type safety
+2. Redis for caching weather data
+3. Rate limiting per API key
+4. Error handling middleware
+5. OpenAPI/Swagger documentation
+"""
+
+DEPLOYMENT_DECISIONS = """Deployment Decisions:
+1. Multi-stage Docker builds
+2. Docker Compose for development
+3. GitHub Actions for CI/CD
+4. Environment variable management
+"""
+
+# Config files written verbatim into the generated project
+VITE_CONFIG = """import { defineConfig } from 'vite'
+import react from '@vitejs/plugin-react'
+
+export default defineConfig({
+  plugins: [react()],
+  server: {
+    proxy: {
+      '/api': 'http://localhost:3001'
+    }
+  }
+})"""
+
+INDEX_HTML = """<!DOCTYPE html>
+<html>
+  <head>
+    <title>Weather App</title>
+  </head>
+  <body>
+    <div id="root"></div>
+    <script type="module" src="/src/main.tsx"></script>
+  </body>
+</html>"""
+
+BACKEND_TSCONFIG = """{
+  "compilerOptions": {
+    "target": "es6",
+    "module": "commonjs",
+    "outDir": "./dist",
+    "rootDir": "./src",
+    "strict": true,
+    "esModuleInterop": true,
+    "skipLibCheck": true
+  },
+  "include": ["src/**/*"]
+}"""
+
+# System messages, one per agent, built only from context that agent has
+# and with nothing interpolated per call, so every request an agent makes
+# starts with the same bytes. OpenAI only caches prompts of at least 1,024
+# tokens; these are about 3,500 and 3,700 characters (an estimated 900 to
+# 1,000 tokens), right at that limit, so new static context belongs here
+# rather than in user prompts.
+
+# smart_agent: the plan and config plus the decisions it stores in memex
+SMART_AGENT_SYSTEM_PROMPT = f"""{SYSTEM_PREAMBLE}{PROJECT_PLAN}
+{PROJECT_CONFIG}
+{FRONTEND_DECISIONS}
+{BACKEND_DECISIONS}
+{DEPLOYMENT_DECISIONS}"""
+
+# smart_agent_v2: the plan and config plus the files it writes itself
+SMART_AGENT_V2_SYSTEM_PROMPT = f"""{SYSTEM_PREAMBLE}{PROJECT_PLAN}
+{PROJECT_CONFIG}
+Files already in the project:
+
+weather-app/frontend/vite.config.ts
+```typescript
+{VITE_CONFIG}
+```
+
+weather-app/frontend/index.html
+```html
+{INDEX_HTML}
+```
+
+weather-app/backend/tsconfig.json
+```json
+{BACKEND_TSCONFIG}
+```
+"""
@@ -0,0 +1,39 @@
+import os
+import json
+import hashlib
+import tempfile
+
+
+class PromptCache:
+    """Disk-backed cache of chat responses, one file per request hash"""
+
+    def __init__(self, directory=".prompt_cache"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(model, messages):
+        """Hash the model and messages into a stable cache key"""
+        payload = json.dumps({"model": model, "messages": messages}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss"""
+        try:
+            with open(os.path.join(self.directory, key), 'r') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, value):
+        """Store a response under key"""
+        # Write to a unique temp file, then rename into place, so concurrent
+        # writers never share a temp file or expose a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(value)
+            os.replace(tmp_path, os.path.join(self.directory, key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
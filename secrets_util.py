@@ -0,0 +1,10 @@
+import os
+import pathlib
+import functools
+
+
+@functools.lru_cache(maxsize=1)
+def get_openai_key():
+    """Return the OpenAI API key from OPENAI_API_KEY, falling back to
+    api_key.txt; loaded once per process"""
+    return os.environ.get("OPENAI_API_KEY") or pathlib.Path("api_key.txt").read_text().strip()
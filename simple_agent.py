@@ -1,11 +1,8 @@
-import os
+import argparse
+import asyncio
 import openai
-
-# Get API key from file
-with open('api_key.txt', 'r') as f:
-    api_key = f.read().strip()
-
-openai.api_key = api_key
+from prompt_cache import PromptCache
+from secrets_util import get_openai_key
 
 # Create the prompt for a simple calculator
 prompt = """Create a simple calculator program in Python that:
@@ -16,19 +13,39 @@ prompt = """Create a simple calculator program in Python that:
 
 Please provide the complete code."""
 
-# Create OpenAI client
-client = openai.OpenAI(api_key=api_key)
-
-# Make the API call
-response = client.chat.completions.create(
-    model="gpt-4o",
-    messages=[
+async def generate_calculator(client, use_cache=True):
+    """Generate the calculator program and save it to calculator.py,
+    reusing a saved response for the same prompt unless use_cache is False"""
+    model = "gpt-4o"
+    messages = [
         {"role": "user", "content": prompt}
     ]
-)
+    prompt_cache = PromptCache()
+    key = PromptCache.key(model, messages)
+    code = prompt_cache.get(key) if use_cache else None
+    if code is not None:
+        print("Using cached response")
+    else:
+        # Make the API call (temperature=0 so a saved response is a fair stand-in)
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0
+        )
+        code = response.choices[0].message.content
+        prompt_cache.put(key, code)
+
+    # Save the generated code to calculator.py
+    print("Saving generated code to calculator.py...")
+    with open('calculator.py', 'w') as f:
+        f.write(code)
+    print("Done! You can now run: python calculator.py")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a simple calculator program")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="regenerate the response instead of reusing .prompt_cache/")
+    args = parser.parse_args()
 
-# Save the generated code to calculator.py
-print("Saving generated code to calculator.py...")
-with open('calculator.py', 'w') as f:
-    f.write(response.choices[0].message.content)
-print("Done! You can now run: python calculator.py")
+    client = openai.AsyncOpenAI(api_key=get_openai_key())
+    asyncio.run(generate_calculator(client, use_cache=not args.no_cache))
@@ -1,15 +1,27 @@
 import os
+import argparse
+import io
+import asyncio
+import atexit
+import tempfile
 import openai
-from subprocess import run
+from subprocess import run, CompletedProcess
+from prompt_cache import PromptCache
+from secrets_util import get_openai_key
+from agent_constants import (
+    ADDED_NODE_RE, MEMEX_ADD_FLAGS, NODE_ID_RE, REQUIRED_DIRS,
+    BACKEND_DECISIONS, DEPLOYMENT_DECISIONS, FRONTEND_DECISIONS,
+    PROJECT_CONFIG, PROJECT_PLAN, SMART_AGENT_SYSTEM_PROMPT
+)
 
 class WeatherAppAgent:
-    def __init__(self):
-        # Read API key
-        with open('api_key.txt', 'r') as f:
-            api_key = f.read().strip()
+    def __init__(self, use_cache=True):
+        # Initialize OpenAI client (shared so requests reuse pooled connections)
+        self.client = openai.AsyncOpenAI(api_key=get_openai_key())
         
-        # Initialize OpenAI client
-        self.client = openai.OpenAI(api_key=api_key)
+        # Responses are always saved; use_cache=False skips reading them back
+        self.prompt_cache = PromptCache()
+        self.use_cache = use_cache
         
         # Initialize memex repository
         run(["memex", "init", "weather-app"])
@@ -18,161 +30,115 @@ class WeatherAppAgent:
         # Dictionary to store node IDs
         self.node_map = {}
         
-    def start_project(self):
+        # In-memory mirror of what this session stored, so reads don't
+        # need to shell out to memex
+        self.content_cache = {}
+        
+        # (source, target, label) links queued until the end of each phase
+        self._pending_links = []
+        
+        # Scratch file handed to `memex add`, truncated and reused per store
+        self._scratch = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+        atexit.register(self._remove_scratch)
+        # Held while the scratch file is written and read by memex, since
+        # stores can now run concurrently
+        self._scratch_lock = asyncio.Lock()
+        # Held from `memex add` until its node ID is known; the `memex status`
+        # fallback reports the latest node, which is only ours if no other
+        # add ran in between
+        self._add_lock = asyncio.Lock()
+        
+    async def start_project(self):
         # Create project structure
-        os.makedirs("weather-app/frontend/src/components", exist_ok=True)
-        os.makedirs("weather-app/frontend/src/hooks", exist_ok=True)
-        os.makedirs("weather-app/backend/src", exist_ok=True)
+        for directory in REQUIRED_DIRS:
+            os.makedirs(directory, exist_ok=True)
 
-        # Store complete project configuration
-        config = """Weather Web App Configuration:
-        
-        # Project Structure
-        /weather-app
-          /frontend
-            /src
-              /components
-              /hooks
-              /types
-            package.json
-            vite.config.ts
-            tsconfig.json
-            index.html
-          /backend
-            /src
-            package.json
-            tsconfig.json
-        
-        # Frontend Dependencies
-        {
-          "dependencies": {
-            "react": "^18.2.0",
-            "react-dom": "^18.2.0",
-            "axios": "^1.6.0",
-            "typescript": "^5.0.0"
-          },
-          "devDependencies": {
-            "@types/react": "^18.2.0",
-            "@types/react-dom": "^18.2.0",
-            "vite": "^5.0.0",
-            "@vitejs/plugin-react": "^4.0.0"
-          }
-        }
-        
-        # Backend Dependencies
-        {
-          "dependencies": {
-            "express": "^4.18.0",
-            "cors": "^2.8.5",
-            "typescript": "^5.0.0",
-            "axios": "^1.6.0"
-          },
-          "devDependencies": {
-            "@types/express": "^4.17.0",
-            "@types/cors": "^2.8.5",
-            "ts-node": "^10.9.0",
-            "nodemon": "^3.0.0"
-          }
-        }
-        
-        # TypeScript Configurations
-        ## Frontend tsconfig.json
-        {
-          "compilerOptions": {
-            "target": "ES2020",
-            "useDefineForClassFields": true,
-            "lib": ["ES2020", "DOM", "DOM.Iterable"],
-            "module": "ESNext",
-            "skipLibCheck": true,
-            "moduleResolution": "bundler",
-            "allowImportingTsExtensions": true,
-            "resolveJsonModule": true,
-            "isolatedModules": true,
-            "noEmit": true,
-            "jsx": "react-jsx",
-            "strict": true,
-            "noUnusedLocals": true,
-            "noUnusedParameters": true,
-            "noFallthroughCasesInSwitch": true
-          },
-          "include": ["src"],
-          "references": [{ "path": "./tsconfig.node.json" }]
-        }
-        
-        # CSS Modules Type Definition
-        declare module '*.module.css' {
-          const classes: { [key: string]: string };
-          export default classes;
-        }
-        """
-        self._store_in_memex(config, "project_config")
-        
-        # Store project plan
-        plan = """Weather Web App Development Plan:
-        1. Frontend Setup (React + TypeScript)
-           - Weather display component
-           - Data fetching hook
-           - Error handling
-           - Loading states
-        
-        2. Backend API (Node/Express)
-           - Weather data endpoint
-           - Caching layer
-           - Error handling
-           - Rate limiting
-        
-        3. Weather API Integration
-           - API key management
-           - Data transformation
-           - Error handling
-           - Backup providers
-        
-        4. User Preferences
-           - Location storage
-           - Temperature unit preference
-           - Update frequency
-        
-        5. Deployment
-           - Environment setup
-           - Docker configuration
-           - CI/CD pipeline
-        """
-        self._store_in_memex(plan, "project_plan")
+        # The static documents don't depend on any generated code, so they
+        # are stored while the component and hook are generated; the hook
+        # doesn't depend on the component either
+        await asyncio.gather(
+            self._store_batch_in_memex([
+                (PROJECT_CONFIG, "project_config"),
+                (PROJECT_PLAN, "project_plan")
+            ]),
+            self._store_in_memex(FRONTEND_DECISIONS, "frontend_decisions"),
+            self._create_frontend(),
+            self._create_data_hook()
+        )
         
-        # Start with frontend
-        self._create_frontend()
+        # Link the frontend nodes once they all exist
+        self._link(
+            self.node_map["weather_display_component"],
+            self.node_map["project_plan"],
+            "implements"
+        )
+        self._link(
+            self.node_map["frontend_decisions"],
+            self.node_map["weather_display_component"],
+            "explains"
+        )
+        self._link(
+            self.node_map["weather_hook"],
+            self.node_map["weather_display_component"],
+            "provides-data"
+        )
+        await self._flush_links()
         
-        # Move to backend
-        self._create_backend()
+        # Move to backend (needs the hook implementation)
+        await self._create_backend()
+        await self._flush_links()
         
-        # Set up deployment
-        self._setup_deployment()
+        # Set up deployment (needs the backend decisions)
+        await self._setup_deployment()
+        await self._flush_links()
+    
+    async def _memex(self, *args):
+        """Run a memex command without blocking the event loop and return
+        the completed process"""
+        proc = await asyncio.create_subprocess_exec(
+            "memex", *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+        return CompletedProcess(["memex", *args], proc.returncode, stdout.decode(), stderr.decode())
+    
+    async def _store_in_memex(self, content, description):
+        """Store free-form content (not a project file) in memex and return the node ID"""
+        async with self._scratch_lock:
+            # Overwrite the scratch file with this content
+            self._scratch.seek(0)
+            self._scratch.truncate()
+            self._scratch.write(content)
+            self._scratch.flush()
+            return await self._add_to_memex(self._scratch.name, content, description)
+    
+    async def _store_artifact(self, path, content, description):
+        """Write a generated file, then add that same file to memex"""
+        self._write_file(path, content)
+        return await self._add_to_memex(path, content, description)
     
-    def _store_in_memex(self, content, description):
-        """Store content in memex and return the node ID"""
+    async def _add_to_memex(self, path, content, description):
+        """Add a file to memex, record its node ID and return it"""
         try:
-            # Save content to temporary file
-            with open("temp.txt", "w") as f:
-                f.write(content)
-            
-            # Add to memex and get the node ID from the output
-            result = run(["memex", "add", "temp.txt"], capture_output=True, text=True)
-            if result.returncode != 0:
-                raise Exception(f"Failed to add to memex: {result.stderr}")
-            
-            # Print raw output for debugging
-            print("Memex add output:", result.stdout)
-            print("Memex add error:", result.stderr)
-            
-            # Try to find the Node ID in the add output
-            import re
-            node_match = re.search(r'Added node: ([0-9a-f]+)', result.stdout)
-            if not node_match:
-                # If not found in add output, try status
-                status_result = run(["memex", "status"], capture_output=True, text=True)
-                if status_result.returncode == 0:
-                    print("Memex status output:", status_result.stdout)
-                    node_match = re.search(r'Node ID: ([0-9a-f]+)', status_result.stdout)
+            async with self._add_lock:
+                # Add to memex and get the node ID from the output
+                result = await self._memex("add", *MEMEX_ADD_FLAGS, path)
+                if result.returncode != 0:
+                    raise Exception(f"Failed to add to memex: {result.stderr}")
+                
+                # Print raw output for debugging
+                print("Memex add output:", result.stdout)
+                print("Memex add error:", result.stderr)
+                
+                # Try to find the Node ID in the add output
+                node_match = ADDED_NODE_RE.search(result.stdout)
+                if not node_match:
+                    # If not found in add output, try status
+                    status_result = await self._memex("status")
+                    if status_result.returncode == 0:
+                        print("Memex status output:", status_result.stdout)
+                        node_match = NODE_ID_RE.search(status_result.stdout)
             
             if not node_match:
                 raise Exception("No Node ID found in output")
@@ -180,25 +146,86 @@ class WeatherAppAgent:
             
             # Store mapping of description to node ID
             self.node_map[description] = node_id
+            self.content_cache[description] = content
             return node_id
             
         except Exception as e:
             print(f"Error storing in memex: {str(e)}")
             raise
+    
+    async def _store_batch_in_memex(self, items):
+        """Store several (content, description) pairs with a single memex add
+        and return their node IDs"""
+        paths = []
+        try:
+            for content, description in items:
+                with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+                    f.write(content)
+                paths.append(f.name)
+            
+            # memex prints one "Added node" line per file, in argument order
+            async with self._add_lock:
+                result = await self._memex("add", *MEMEX_ADD_FLAGS, *paths)
+            if result.returncode != 0:
+                raise Exception(f"Failed to add to memex: {result.stderr}")
+            
+            print("Memex add output:", result.stdout)
+            
+            node_ids = ADDED_NODE_RE.findall(result.stdout)
+            if len(node_ids) != len(items):
+                # This memex build doesn't report one ID per file; add the
+                # files one at a time so each can use the status fallback
+                return [
+                    await self._add_to_memex(path, content, description)
+                    for path, (content, description) in zip(paths, items)
+                ]
+            
+            for (content, description), node_id in zip(items, node_ids):
+                self.node_map[description] = node_id
+                self.content_cache[description] = content
+            return node_ids
+            
+        except Exception as e:
+            print(f"Error storing in memex: {str(e)}")
+            raise
             
         finally:
-            # Clean up temp file
-            if os.path.exists("temp.txt"):
-                os.remove("temp.txt")
+            for path in paths:
+                os.remove(path)
+    
+    def _remove_scratch(self):
+        """Close and delete the memex scratch file"""
+        self._scratch.close()
+        if os.path.exists(self._scratch.name):
+            os.remove(self._scratch.name)
+    
+    def _link(self, source, target, label):
+        """Queue a memex link between two node IDs"""
+        self._pending_links.append((source, target, label))
     
-    def _get_memex_content(self, description):
+    async def _flush_links(self):
+        """Create all queued links concurrently; the linked nodes must
+        already be stored"""
+        links, self._pending_links = self._pending_links, []
+        results = await asyncio.gather(*(
+            self._memex("link", source, target, label)
+            for source, target, label in links
+        ))
+        for (source, target, label), result in zip(links, results):
+            if result.returncode != 0:
+                print(f"Error linking {source} -> {target} ({label}) in memex: {result.stderr}")
+    
+    async def _get_memex_content(self, description):
         """Get content from memex using stored node ID"""
+        if description in self.content_cache:
+            return self.content_cache[description]
+        
         if description not in self.node_map:
             print(f"Warning: No node ID found for '{description}'")
             return ""
             
         node_id = self.node_map[description]
-        result = run(["memex", "cat", node_id], capture_output=True, text=True)
+        result = await self._memex("cat", node_id)
         
         if result.returncode != 0:
             print(f"Error reading from memex: {result.stderr}")
@@ -206,14 +233,45 @@ class WeatherAppAgent:
             
         return result.stdout
 
-    def _create_frontend(self):
-        # First check what we know about the project
-        project_plan = self._get_memex_content("project_plan")
+    def _messages(self, prompt):
+        """Build chat messages: static system prefix first, dynamic prompt last"""
+        return [
+            {"role": "system", "content": SMART_AGENT_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    async def _chat(self, prompt, **kwargs):
+        """Stream a completion for the prompt and return the full text,
+        answering from the prompt cache when an identical request was made before"""
+        model = "gpt-4o"
+        messages = self._messages(prompt)
+        key = PromptCache.key(model, messages)
+        if self.use_cache:
+            cached = self.prompt_cache.get(key)
+            if cached is not None:
+                print("Using cached response")
+                return cached
+        
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0,
+            stream=True,
+            **kwargs
+        )
         
-        prompt = f"""Create a React component for weather display.
-        Project Context:
-        {project_plan}
+        buffer = io.StringIO()
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                buffer.write(chunk.choices[0].delta.content)
         
+        content = buffer.getvalue()
+        self.prompt_cache.put(key, content)
+        return content
+    
+    async def _create_frontend(self):
+        # The project plan is already part of the system message
+        prompt = """Create a React component for weather display.
         Requirements:
         - Show current temperature
         - Show weather condition
@@ -225,13 +283,7 @@ class WeatherAppAgent:
         
         try:
             print("\nGenerating weather display component...")
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                timeout=60  # 60 second timeout
-            )
+            component = await self._chat(prompt, timeout=60)
             print("Successfully generated weather display component")
         except KeyboardInterrupt:
             print("\nGeneration interrupted. Cleaning up...")
@@ -240,48 +292,16 @@ class WeatherAppAgent:
             print("\nError generating weather display component:", str(e))
             raise
         
-        # Store the component code
-        component = response.choices[0].message.content
-        self._store_in_memex(component, "weather_display_component")
-        
-        # Write component to file
-        self._write_file(
+        # Write the component and store it in memex
+        await self._store_artifact(
             "weather-app/frontend/src/components/WeatherDisplay.tsx",
-            component
+            component,
+            "weather_display_component"
         )
-        
-        # Store the design decisions
-        decisions = """Design Decisions for Weather Display:
-        1. Using functional components with hooks for modern React practices
-        2. TypeScript for type safety
-        3. CSS modules for scoped styling
-        4. Component will fetch data through a custom hook
-        """
-        self._store_in_memex(decisions, "frontend_decisions")
-        
-        # Create relationships
-        run(["memex", "link", 
-            self.node_map["weather_display_component"],
-            self.node_map["project_plan"],
-            "implements"
-        ])
-        run(["memex", "link",
-            self.node_map["frontend_decisions"],
-            self.node_map["weather_display_component"],
-            "explains"
-        ])
-        
-        # Move on to creating the data fetching hook
-        self._create_data_hook()
     
-    def _create_data_hook(self):
-        # Read previous decisions
-        frontend_decisions = self._get_memex_content("frontend_decisions")
-        
-        prompt = f"""Create a React hook for fetching weather data.
-        Previous Decisions:
-        {frontend_decisions}
-        
+    async def _create_data_hook(self):
+        # The frontend decisions are already part of the system message
+        prompt = """Create a React hook for fetching weather data.
         Requirements:
         - Handle loading states
         - Error handling
@@ -291,13 +311,7 @@ class WeatherAppAgent:
         
         try:
             print("\nGenerating weather data hook...")
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                timeout=60
-            )
+            hook = await self._chat(prompt, timeout=60)
             print("Successfully generated weather data hook")
         except KeyboardInterrupt:
             print("\nGeneration interrupted. Cleaning up...")
@@ -306,38 +320,25 @@ class WeatherAppAgent:
             print("\nError generating weather data hook:", str(e))
             raise
         
-        # Store the hook code
-        hook = response.choices[0].message.content
-        self._store_in_memex(hook, "weather_hook")
-        
-        # Write hook to file
-        self._write_file(
+        # Write the hook and store it in memex
+        await self._store_artifact(
             "weather-app/frontend/src/hooks/useWeather.ts",
-            hook
+            hook,
+            "weather_hook"
         )
-        
-        # Link it to related components
-        run(["memex", "link",
-            self.node_map["weather_hook"],
-            self.node_map["weather_display_component"],
-            "provides-data"
-        ])
 
     def _write_file(self, path, content):
-        """Write content to a file, creating directories if needed"""
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+        """Write content to a file (parent dirs come from REQUIRED_DIRS)"""
         with open(path, 'w') as f:
             f.write(content)
         print(f"Created: {path}")
 
-    def _create_backend(self):
-        # Read frontend decisions to understand data needs
-        frontend_decisions = self._get_memex_content("frontend_decisions")
-        hook_code = self._get_memex_content("weather_hook")
+    async def _create_backend(self):
+        # Read the hook to understand data needs (decisions are already part
+        # of the system message)
+        hook_code = await self._get_memex_content("weather_hook")
         
         prompt = f"""Create an Express.js backend for weather data.
-        Frontend Context:
-        {frontend_decisions}
         Hook Implementation:
         {hook_code}
         
@@ -349,56 +350,33 @@ class WeatherAppAgent:
         - Rate limiting
         """
         
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+        backend_code = await self._chat(prompt)
         
-        # Store the backend code
-        backend_code = response.choices[0].message.content
-        self._store_in_memex(backend_code, "backend_implementation")
-        
-        # Store backend decisions
-        backend_decisions = """Backend Design Decisions:
-        1. Express.js with TypeScript for type safety
-        2. Redis for caching weather data
-        3. Rate limiting per API key
-        4. Error handling middleware
-        5. OpenAPI/Swagger documentation
-        """
-        self._store_in_memex(backend_decisions, "backend_decisions")
+        # Write the backend code and store it alongside the backend decisions
+        await asyncio.gather(
+            self._store_artifact(
+                "weather-app/backend/src/server.ts",
+                backend_code,
+                "backend_implementation"
+            ),
+            self._store_in_memex(BACKEND_DECISIONS, "backend_decisions")
+        )
         
         # Create relationships
-        run(["memex", "link",
+        self._link(
             self.node_map["backend_implementation"],
             self.node_map["weather_hook"],
             "serves"
-        ])
-        run(["memex", "link",
+        )
+        self._link(
             self.node_map["backend_decisions"],
             self.node_map["backend_implementation"],
             "explains"
-        ])
-        
-        # Create actual files
-        self._write_file(
-            "weather-app/backend/src/server.ts",
-            backend_code
         )
 
-    def _setup_deployment(self):
-        # Read all previous decisions
-        backend_decisions = self._get_memex_content("backend_decisions")
-        frontend_decisions = self._get_memex_content("frontend_decisions")
-        
-        prompt = f"""Create deployment configuration.
-        Backend Context:
-        {backend_decisions}
-        Frontend Context:
-        {frontend_decisions}
-        
+    async def _setup_deployment(self):
+        # All design decisions are already part of the system message
+        prompt = """Create deployment configuration.
         Requirements:
         - Docker configuration
         - Docker Compose for local dev
@@ -408,13 +386,7 @@ class WeatherAppAgent:
         
         try:
             print("\nGenerating deployment configuration...")
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                timeout=60
-            )
+            deployment_config = await self._chat(prompt, timeout=60)
             print("Successfully generated deployment configuration")
         except KeyboardInterrupt:
             print("\nGeneration interrupted. Cleaning up...")
@@ -423,37 +395,33 @@ class WeatherAppAgent:
             print("\nError generating deployment configuration:", str(e))
             raise
         
-        # Store deployment config
-        deployment_config = response.choices[0].message.content
-        self._store_in_memex(deployment_config, "deployment_config")
-        
-        # Store deployment decisions
-        deployment_decisions = """Deployment Decisions:
-        1. Multi-stage Docker builds
-        2. Docker Compose for development
-        3. GitHub Actions for CI/CD
-        4. Environment variable management
-        """
-        self._store_in_memex(deployment_decisions, "deployment_decisions")
+        # Write the deployment config and store it alongside the decisions
+        await asyncio.gather(
+            self._store_artifact(
+                "weather-app/Dockerfile",
+                deployment_config,
+                "deployment_config"
+            ),
+            self._store_in_memex(DEPLOYMENT_DECISIONS, "deployment_decisions")
+        )
         
         # Create relationships
-        run(["memex", "link",
+        self._link(
             self.node_map["deployment_config"],
             self.node_map["backend_implementation"],
             "deploys"
-        ])
-        run(["memex", "link",
+        )
+        self._link(
             self.node_map["deployment_decisions"],
             self.node_map["deployment_config"],
             "explains"
-        ])
-        
-        # Create actual files
-        self._write_file(
-            "weather-app/Dockerfile",
-            deployment_config
         )
 
 if __name__ == "__main__":
-    agent = WeatherAppAgent()
-    agent.start_project()
+    parser = argparse.ArgumentParser(description="Generate the weather app with memex context")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="regenerate every response instead of reusing .prompt_cache/")
+    args = parser.parse_args()
+    
+    agent = WeatherAppAgent(use_cache=not args.no_cache)
+    asyncio.run(agent.start_project())
@@ -1,17 +1,35 @@
 import os
+import argparse
+import io
+import asyncio
+import atexit
+import tempfile
 import json
 import re
-from subprocess import run
+from subprocess import run, CompletedProcess
 import openai
+from prompt_cache import PromptCache
+from secrets_util import get_openai_key
+from agent_constants import (
+    ADDED_NODE_RE, MEMEX_ADD_FLAGS, NODE_ID_RE, REQUIRED_DIRS,
+    PROJECT_CONFIG, PROJECT_SETTINGS,
+    BACKEND_TSCONFIG, INDEX_HTML, PROJECT_PLAN, SMART_AGENT_V2_SYSTEM_PROMPT,
+    VITE_CONFIG
+)
+
+# Any fenced code block: an opening fence at the start of a line with a
+# language tag and optional info string (e.g. title="App.tsx"), then the
+# body up to the closing fence
+_FENCE_RE = re.compile(r'^```([\w+-]*)[^\n]*\n(.*?)\n```', re.DOTALL | re.MULTILINE)
 
 class WeatherAppAgent:
-    def __init__(self):
-        # Read API key
-        with open('api_key.txt', 'r') as f:
-            api_key = f.read().strip()
+    def __init__(self, use_cache=True):
+        # Initialize OpenAI client (shared so requests reuse pooled connections)
+        self.client = openai.AsyncOpenAI(api_key=get_openai_key())
         
-        # Initialize OpenAI client
-        self.client = openai.OpenAI(api_key=api_key)
+        # Responses are always saved; use_cache=False skips reading them back
+        self.prompt_cache = PromptCache()
+        self.use_cache = use_cache
         
         # Initialize memex repository
         run(["memex", "init", "weather-app"])
@@ -19,290 +37,245 @@ class WeatherAppAgent:
         
         # Dictionary to store node IDs
         self.node_map = {}
+        
+        # In-memory mirror of what this session stored, so reads don't
+        # need to shell out to memex
+        self.content_cache = {}
+        
+        # Scratch file handed to `memex add`, truncated and reused per store
+        self._scratch = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+        atexit.register(self._remove_scratch)
+        # Held while the scratch file is written and read by memex, since
+        # stores can now run concurrently
+        self._scratch_lock = asyncio.Lock()
+        # Held from `memex add` until its node ID is known; the `memex status`
+        # fallback reports the latest node, which is only ours if no other
+        # add ran in between
+        self._add_lock = asyncio.Lock()
     
-    def _extract_section(self, content, section_name):
-        """Extract a section from the configuration content"""
-        pattern = f"# {section_name}\\s+([^#]+)"
-        match = re.search(pattern, content, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return ""
-    
-    def _extract_json(self, content, section_name):
-        """Extract and parse JSON from a section"""
-        section = self._extract_section(content, section_name)
-        # Find JSON object between curly braces
-        match = re.search(r'\{[^}]+\}', section, re.DOTALL)
-        if match:
-            return match.group(0)
-        return "{}"
-    
-    def _extract_code(self, content, language):
-        """Extract code from markdown content"""
-        pattern = f"```{language}\\s*\\n([^`]+)\\n```"
-        match = re.search(pattern, content, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return content  # Return full content if no code block found
+    def _extract_all_code(self, content):
+        """Extract every fenced code block from markdown content in one pass,
+        keyed by lowercased language (first block wins)"""
+        blocks = {}
+        for match in _FENCE_RE.finditer(content):
+            blocks.setdefault(match.group(1).lower(), match.group(2).strip())
+        return blocks
     
-    def start_project(self):
+    async def start_project(self):
         """Initialize and create the project"""
-        # Store project configuration and plan
-        self._store_project_config()
-        
-        # Generate project structure and config files
-        self._setup_project_structure()
+        # Create project structure
+        for directory in REQUIRED_DIRS:
+            os.makedirs(directory, exist_ok=True)
+        
+        # Storing the configuration and plan and writing the config files
+        # don't depend on generated code, so both happen while the frontend
+        # component is being generated
+        await asyncio.gather(
+            self._store_project_config(),
+            asyncio.to_thread(self._setup_project_structure),
+            self._create_frontend()
+        )
         
-        # Generate components and code
-        self._create_frontend()
-        self._create_backend()
-        self._setup_deployment()
+        # Backend builds on the frontend code, deployment on the backend
+        await self._create_backend()
+        await self._setup_deployment()
     
-    def _store_project_config(self):
+    async def _store_project_config(self):
         """Store project configuration in memex"""
-        config = """Weather Web App Configuration:
-        
-        # Project Structure
-        /weather-app
-          /frontend
-            /src
-              /components
-              /hooks
-              /types
-            package.json
-            vite.config.ts
-            tsconfig.json
-            index.html
-          /backend
-            /src
-            package.json
-            tsconfig.json
-        
-        # Frontend Dependencies
-        {
-          "dependencies": {
-            "react": "^18.2.0",
-            "react-dom": "^18.2.0",
-            "axios": "^1.6.0",
-            "typescript": "^5.0.0"
-          },
-          "devDependencies": {
-            "@types/react": "^18.2.0",
-            "@types/react-dom": "^18.2.0",
-            "vite": "^5.0.0",
-            "@vitejs/plugin-react": "^4.0.0"
-          }
-        }
-        
-        # Backend Dependencies
-        {
-          "dependencies": {
-            "express": "^4.18.0",
-            "cors": "^2.8.5",
-            "typescript": "^5.0.0",
-            "axios": "^1.6.0"
-          },
-          "devDependencies": {
-            "@types/express": "^4.17.0",
-            "@types/cors": "^2.8.5",
-            "ts-node": "^10.9.0",
-            "nodemon": "^3.0.0"
-          }
-        }
-        
-        # Frontend TypeScript Config
-        {
-          "compilerOptions": {
-            "target": "ES2020",
-            "useDefineForClassFields": true,
-            "lib": ["ES2020", "DOM", "DOM.Iterable"],
-            "module": "ESNext",
-            "skipLibCheck": true,
-            "moduleResolution": "bundler",
-            "allowImportingTsExtensions": true,
-            "resolveJsonModule": true,
-            "isolatedModules": true,
-            "noEmit": true,
-            "jsx": "react-jsx",
-            "strict": true,
-            "noUnusedLocals": true,
-            "noUnusedParameters": true,
-            "noFallthroughCasesInSwitch": true
-          },
-          "include": ["src"],
-          "references": [{ "path": "./tsconfig.node.json" }]
-        }
-        
-        # CSS Modules Type Definition
-        declare module '*.module.css' {
-          const classes: { [key: string]: string };
-          export default classes;
-        }
-        """
-        self._store_in_memex(config, "project_config")
-        
-        plan = """Weather Web App Development Plan:
-        1. Frontend Setup (React + TypeScript)
-           - Weather display component
-           - Data fetching hook
-           - Error handling
-           - Loading states
-        
-        2. Backend API (Node/Express)
-           - Weather data endpoint
-           - Caching layer
-           - Error handling
-           - Rate limiting
-        
-        3. Weather API Integration
-           - API key management
-           - Data transformation
-           - Error handling
-           - Backup providers
-        
-        4. User Preferences
-           - Location storage
-           - Temperature unit preference
-           - Update frequency
-        
-        5. Deployment
-           - Environment setup
-           - Docker configuration
-           - CI/CD pipeline
-        """
-        self._store_in_memex(plan, "project_plan")
+        await self._store_batch_in_memex([
+            (PROJECT_CONFIG, "project_config"),
+            (PROJECT_PLAN, "project_plan")
+        ])
     
     def _setup_project_structure(self):
-        """Create project structure and configuration files"""
-        config = self._get_memex_content("project_config")
-        
-        # Create directories
-        os.makedirs("weather-app/frontend/src/components", exist_ok=True)
-        os.makedirs("weather-app/frontend/src/hooks", exist_ok=True)
-        os.makedirs("weather-app/frontend/src/types", exist_ok=True)
-        os.makedirs("weather-app/backend/src", exist_ok=True)
-        
+        """Write project configuration files"""
         # Frontend configuration
         self._write_file(
             "weather-app/frontend/package.json",
-            self._extract_json(config, "Frontend Dependencies")
+            json.dumps(PROJECT_SETTINGS["frontend_deps"], indent=2)
         )
         
         self._write_file(
             "weather-app/frontend/tsconfig.json",
-            self._extract_json(config, "Frontend TypeScript Config")
+            json.dumps(PROJECT_SETTINGS["frontend_tsconfig"], indent=2)
         )
         
         self._write_file(
             "weather-app/frontend/src/types/css.d.ts",
-            self._extract_section(config, "CSS Modules Type Definition")
+            PROJECT_SETTINGS["css_modules_types"]
         )
         
         self._write_file(
             "weather-app/frontend/vite.config.ts",
-            """import { defineConfig } from 'vite'
-import react from '@vitejs/plugin-react'
-
-export default defineConfig({
-  plugins: [react()],
-  server: {
-    proxy: {
-      '/api': 'http://localhost:3001'
-    }
-  }
-})"""
+            VITE_CONFIG
         )
         
         self._write_file(
             "weather-app/frontend/index.html",
-            """<!DOCTYPE html>
-<html>
-  <head>
-    <title>Weather App</title>
-  </head>
-  <body>
-    <div id="root"></div>
-    <script type="module" src="/src/main.tsx"></script>
-  </body>
-</html>"""
+            INDEX_HTML
         )
         
         # Backend configuration
         self._write_file(
             "weather-app/backend/package.json",
-            self._extract_json(config, "Backend Dependencies")
+            json.dumps(PROJECT_SETTINGS["backend_deps"], indent=2)
         )
         
         self._write_file(
             "weather-app/backend/tsconfig.json",
-            """{
-  "compilerOptions": {
-    "target": "es6",
-    "module": "commonjs",
-    "outDir": "./dist",
-    "rootDir": "./src",
-    "strict": true,
-    "esModuleInterop": true,
-    "skipLibCheck": true
-  },
-  "include": ["src/**/*"]
-}"""
+            BACKEND_TSCONFIG
         )
     
-    def _store_in_memex(self, content, description):
-        """Store content in memex and return the node ID"""
-        try:
-            with open("temp.txt", "w") as f:
-                f.write(content)
-            
-            result = run(["memex", "add", "temp.txt"], capture_output=True, text=True)
+    async def _memex(self, *args):
+        """Run a memex command without blocking the event loop and return
+        the completed process"""
+        proc = await asyncio.create_subprocess_exec(
+            "memex", *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+        return CompletedProcess(["memex", *args], proc.returncode, stdout.decode(), stderr.decode())
+    
+    async def _store_in_memex(self, content, description):
+        """Store free-form content (not a project file) in memex and return the node ID"""
+        async with self._scratch_lock:
+            # Overwrite the scratch file with this content
+            self._scratch.seek(0)
+            self._scratch.truncate()
+            self._scratch.write(content)
+            self._scratch.flush()
+            return await self._add_to_memex(self._scratch.name, content, description)
+    
+    async def _store_artifact(self, path, content, description):
+        """Write a generated file, then add that same file to memex"""
+        self._write_file(path, content)
+        return await self._add_to_memex(path, content, description)
+    
+    async def _add_to_memex(self, path, content, description):
+        """Add a file to memex, record its node ID and return it"""
+        async with self._add_lock:
+            result = await self._memex("add", *MEMEX_ADD_FLAGS, path)
             if result.returncode != 0:
                 raise Exception(f"Failed to add to memex: {result.stderr}")
             
             print("Memex add output:", result.stdout)
             
-            node_match = re.search(r'Added node: ([0-9a-f]+)', result.stdout)
+            node_match = ADDED_NODE_RE.search(result.stdout)
             if not node_match:
-                status_result = run(["memex", "status"], capture_output=True, text=True)
+                status_result = await self._memex("status")
                 if status_result.returncode == 0:
-                    node_match = re.search(r'Node ID: ([0-9a-f]+)', status_result.stdout)
+                    node_match = NODE_ID_RE.search(status_result.stdout)
+        
+        if not node_match:
+            raise Exception("No Node ID found in output")
+        
+        node_id = node_match.group(1)
+        self.node_map[description] = node_id
+        self.content_cache[description] = content
+        return node_id
+    
+    async def _store_batch_in_memex(self, items):
+        """Store several (content, description) pairs with a single memex add
+        and return their node IDs"""
+        paths = []
+        try:
+            for content, description in items:
+                with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+                    f.write(content)
+                paths.append(f.name)
             
-            if not node_match:
-                raise Exception("No Node ID found in output")
+            # memex prints one "Added node" line per file, in argument order
+            async with self._add_lock:
+                result = await self._memex("add", *MEMEX_ADD_FLAGS, *paths)
+            if result.returncode != 0:
+                raise Exception(f"Failed to add to memex: {result.stderr}")
             
-            node_id = node_match.group(1)
-            self.node_map[description] = node_id
-            return node_id
+            print("Memex add output:", result.stdout)
+            
+            node_ids = ADDED_NODE_RE.findall(result.stdout)
+            if len(node_ids) != len(items):
+                # This memex build doesn't report one ID per file; add the
+                # files one at a time so each can use the status fallback
+                return [
+                    await self._add_to_memex(path, content, description)
+                    for path, (content, description) in zip(paths, items)
+                ]
+            
+            for (content, description), node_id in zip(items, node_ids):
+                self.node_map[description] = node_id
+                self.content_cache[description] = content
+            return node_ids
             
         finally:
-            if os.path.exists("temp.txt"):
-                os.remove("temp.txt")
+            for path in paths:
+                os.remove(path)
+    
+    def _remove_scratch(self):
+        """Close and delete the memex scratch file"""
+        self._scratch.close()
+        if os.path.exists(self._scratch.name):
+            os.remove(self._scratch.name)
     
-    def _get_memex_content(self, description):
+    async def _get_memex_content(self, description):
         """Get content from memex using stored node ID"""
+        if description in self.content_cache:
+            return self.content_cache[description]
+        
         if description not in self.node_map:
             return ""
         
         node_id = self.node_map[description]
-        result = run(["memex", "cat", node_id], capture_output=True, text=True)
+        result = await self._memex("cat", node_id)
         return result.stdout if result.returncode == 0 else ""
     
+    def _messages(self, prompt):
+        """Build chat messages: static system prefix first, dynamic prompt last"""
+        return [
+            {"role": "system", "content": SMART_AGENT_V2_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    async def _chat(self, prompt, **kwargs):
+        """Stream a completion for the prompt and return the full text,
+        answering from the prompt cache when an identical request was made before"""
+        model = "gpt-4o"
+        messages = self._messages(prompt)
+        key = PromptCache.key(model, messages)
+        if self.use_cache:
+            cached = self.prompt_cache.get(key)
+            if cached is not None:
+                print("Using cached response")
+                return cached
+        
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0,
+            stream=True,
+            **kwargs
+        )
+        
+        buffer = io.StringIO()
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                buffer.write(chunk.choices[0].delta.content)
+        
+        content = buffer.getvalue()
+        self.prompt_cache.put(key, content)
+        return content
+    
     def _write_file(self, path, content):
-        """Write content to a file, creating directories if needed"""
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+        """Write content to a file (parent dirs come from REQUIRED_DIRS)"""
         with open(path, 'w') as f:
             f.write(content)
         print(f"Created: {path}")
     
-    def _create_frontend(self):
+    async def _create_frontend(self):
         """Generate frontend components"""
-        project_plan = self._get_memex_content("project_plan")
-        
-        # Generate weather display component
-        prompt = f"""Create a React component for weather display.
-        Project Context:
-        {project_plan}
-        
+        # Generate weather display component (the project plan and config
+        # are already part of the system message)
+        prompt = """Create a React component for weather display.
         Requirements:
         - Show current temperature
         - Show weather condition
@@ -310,41 +283,40 @@ export default defineConfig({
         - Use modern React practices (hooks, functional components)
         - Include proper TypeScript types
         - Add styling (CSS modules)
+        
+        Return both files in this one response: the component in a ```tsx
+        block importing './WeatherDisplay.module.css', and its styles in a
+        ```css block.
         """
         
         try:
             print("\nGenerating weather display component...")
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                timeout=60
-            )
+            component = await self._chat(prompt, timeout=60)
             
-            component = response.choices[0].message.content
-            component_id = self._store_in_memex(component, "weather_display_component")
-            
-            # Extract and write component code
-            component_code = self._extract_code(component, "tsx")
-            self._write_file(
+            # Extract and write component code, then store that file in memex
+            blocks = self._extract_all_code(component)
+            component_code = blocks.get("tsx", component)
+            await self._store_artifact(
                 "weather-app/frontend/src/components/WeatherDisplay.tsx",
-                component_code
+                component_code,
+                "weather_display_component"
             )
             
             # Extract and write CSS
-            css_match = re.search(r'```css\s*\n([^`]+)\n```', component, re.DOTALL)
-            if css_match:
+            css_code = blocks.get("css")
+            if css_code:
                 self._write_file(
                     "weather-app/frontend/src/components/WeatherDisplay.module.css",
-                    css_match.group(1).strip()
+                    css_code
                 )
             
         except Exception as e:
             print(f"Error generating frontend component: {str(e)}")
             raise
     
-    def _create_backend(self):
+    async def _create_backend(self):
         """Generate backend code"""
-        frontend_code = self._get_memex_content("weather_display_component")
+        frontend_code = await self._get_memex_content("weather_display_component")
         
         prompt = f"""Create an Express.js backend for the weather app.
         Frontend Implementation:
@@ -360,29 +332,23 @@ export default defineConfig({
         
         try:
             print("\nGenerating backend code...")
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                timeout=60
-            )
-            
-            backend = response.choices[0].message.content
-            backend_id = self._store_in_memex(backend, "backend_implementation")
+            backend = await self._chat(prompt, timeout=60)
             
-            # Extract and write backend code
-            backend_code = self._extract_code(backend, "typescript")
-            self._write_file(
+            # Extract and write backend code, then store that file in memex
+            backend_code = self._extract_all_code(backend).get("typescript", backend)
+            await self._store_artifact(
                 "weather-app/backend/src/server.ts",
-                backend_code
+                backend_code,
+                "backend_implementation"
             )
             
         except Exception as e:
             print(f"Error generating backend code: {str(e)}")
             raise
     
-    def _setup_deployment(self):
+    async def _setup_deployment(self):
         """Generate deployment configuration"""
-        backend_code = self._get_memex_content("backend_implementation")
+        backend_code = await self._get_memex_content("backend_implementation")
         
         prompt = f"""Create deployment configuration for the weather app.
         Backend Implementation:
@@ -397,20 +363,15 @@ export default defineConfig({
         
         try:
             print("\nGenerating deployment configuration...")
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                timeout=60
-            )
-            
-            deployment = response.choices[0].message.content
-            deployment_id = self._store_in_memex(deployment, "deployment_config")
+            deployment = await self._chat(prompt, timeout=60)
             
-            # Extract and write deployment files
-            docker_code = self._extract_code(deployment, "dockerfile")
-            self._write_file("weather-app/Dockerfile", docker_code)
+            # Extract and write deployment files; the Dockerfile is the
+            # deployment node in memex
+            blocks = self._extract_all_code(deployment)
+            docker_code = blocks.get("dockerfile", deployment)
+            await self._store_artifact("weather-app/Dockerfile", docker_code, "deployment_config")
             
-            compose_code = self._extract_code(deployment, "yaml")
+            compose_code = blocks.get("yaml", deployment)
             self._write_file("weather-app/docker-compose.yml", compose_code)
             
         except Exception as e:
@@ -418,5 +379,10 @@ export default defineConfig({
             raise
 
 if __name__ == "__main__":
-    agent = WeatherAppAgent()
-    agent.start_project()
+    parser = argparse.ArgumentParser(description="Generate the weather app with memex context")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="regenerate every response instead of reusing .prompt_cache/")
+    args = parser.parse_args()
+    
+    agent = WeatherAppAgent(use_cache=not args.no_cache)
+    asyncio.run(agent.start_project())